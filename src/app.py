@@ -1,57 +1,196 @@
+import eventlet
+# Threads stay native: Pathway's engine, its connector thread and the Twelve Data fetch pool all block
+# outside the hub, so they must be real OS threads. Sockets, time and select are still green.
+eventlet.monkey_patch(thread=False)
+
 import sys
 import os
 import requests
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, make_response, stream_with_context
 from flask_socketio import SocketIO
+from flask_caching import Cache
+import hashlib
 import sqlite3
-import pandas as pd
-import threading
+import eventlet.queue
+from eventlet import tpool
+import orjson
+import msgspec
+import ahocorasick
+from contextlib import contextmanager
+from typing import Union
 from loguru import logger
-from llm_query import query_llm
+from llm_query import stream_llm
+from ingestion import create_alert, pipeline
 from datetime import datetime, timedelta
 import time
 
 app = Flask(__name__, template_folder="../templates")
 app.config["SECRET_KEY"] = "your-secret-key"
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet")
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache"})
+# pw.run() blocks inside Pathway's engine without yielding to the eventlet hub,
+# so the pipeline still needs a real OS thread rather than a greenlet
+native_threading = eventlet.patcher.original("threading")
+native_queue = eventlet.patcher.original("queue")
 
-# Logging setup
+# Logging setup for the whole server, including the imported ingestion and llm_query modules.
+# The file sink writes from a background queue so request threads never block on disk
+LOG_LEVEL = os.getenv("LOGLEVEL", "INFO")
 logger.remove()
 logger.add(
     "stocks_data.log",
     format="{time} - {name} - {level} - {message}",
-    level="DEBUG",
+    level=LOG_LEVEL,
     rotation="10 MB",
+    enqueue=True,
 )
-logger.add(
-    lambda msg: print(msg, end=""),
-    format="{time} - {name} - {level} - {message}",
-    level="DEBUG",
-)
+if os.getenv("FLASK_ENV") == "development":
+    logger.add(
+        lambda msg: print(msg, end=""),
+        format="{time} - {name} - {level} - {message}",
+        level="DEBUG",
+    )
 
 DB_PATH = "stock_history.db"
-current_symbols = ["NVDA", "AAPL", "MSFT", "GOOGL"]
+LAST_PRICE_TTL = 0.5  # Seconds a cached latest price stays fresh; ingestion writes far less often
+QUERY_KEYWORDS = ("notify", "increase", "change")
+NEWS_CACHE_TIMEOUT = 60  # News only changes at ingestion cadence
+# Symbols arrive as a single JSON array parameter so the statement text never changes
+# and SQLite's per-connection statement cache can reuse the prepared plan
+DATA_QUERY = """
+SELECT symbol, price, datetime, moving_avg, volatility
+FROM (
+    SELECT symbol, price, datetime, moving_avg, volatility,
+           ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY datetime DESC) AS rn
+    FROM stock_data
+    WHERE symbol IN (SELECT value FROM json_each(?))
+)
+WHERE rn <= 100
+ORDER BY datetime DESC
+"""
+DB_POOL_SIZE = 8  # Matches the number of request threads we expect to serve concurrently
+current_symbols = ("NVDA", "AAPL", "MSFT", "GOOGL")
+data_query_cache = {"symbols": None, "param": None}
 pipeline_thread = None
+ipo_cache_date = None
+ipo_cache_data = None
+ipo_cache_json = None
+last_price_cache = {}
 POLYGON_API_KEY = os.getenv("POLYGON_API_KEY", "YOUR_POLYGON_API_KEY_HERE")  # Use environment variable or placeholder
 
-def get_db_connection():
+class AlertRequest(msgspec.Struct):
+    alert_type: str = ""
+    symbol: str = ""
+    value: Union[str, float] = ""  # Clients send the threshold either as text or as a JSON number
+    sid: str = ""
+
+class SymbolsRequest(msgspec.Struct):
+    symbols: str = ""
+
+def create_db_connection():
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
         conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-20000")
         logger.debug("Database connection established")
         return conn
     except Exception as e:
         logger.error(f"Database connection error: {e}")
         raise
 
+# Green queue: a handler waiting for a connection yields to the hub instead of blocking it
+db_pool = eventlet.queue.Queue(maxsize=DB_POOL_SIZE)
+for _ in range(DB_POOL_SIZE):
+    db_pool.put(create_db_connection())
+
+@contextmanager
+def borrow_conn():
+    """Borrow a warm connection from the pool and hand it back when done"""
+    conn = db_pool.get()
+    try:
+        yield conn
+    finally:
+        db_pool.put(conn)
+
+def build_query_automaton(symbols):
+    """Build a single-pass matcher for the query intent keywords plus the watched symbols"""
+    automaton = ahocorasick.Automaton()
+    for keyword in QUERY_KEYWORDS + tuple(s.lower() for s in symbols):
+        automaton.add_word(keyword, keyword)
+    automaton.make_automaton()
+    return automaton
+
+query_automaton = build_query_automaton(current_symbols)
+symbols_lower_to_upper = {s.lower(): s for s in current_symbols}
+
+def get_last_price(symbol):
+    """Return the latest stored price for a symbol, briefly cached to absorb bursts of alert requests"""
+    now = time.monotonic()
+    cached = last_price_cache.get(symbol)
+    if cached and now - cached[1] < LAST_PRICE_TTL:
+        return cached[0]
+    with borrow_conn() as conn:
+        result = conn.execute(
+            "SELECT price FROM stock_data WHERE symbol = ? ORDER BY datetime DESC LIMIT 1",
+            (symbol,),
+        ).fetchone()
+    price = result["price"] if result else None
+    last_price_cache[symbol] = (price, now)
+    return price
+
+def emit_query_response(response, sid):
+    """Send a query_response to the SocketIO client that made the request, never to everyone"""
+    if sid:
+        logger.info(f"Emitting query_response: {response}")
+        socketio.emit("query_response", {"response": response}, to=sid)
+
+class IngestionEvents:
+    """Stands in for socketio inside the ingestion threads; emits are queued for the hub to send"""
+
+    def __init__(self):
+        self.queue = native_queue.Queue()
+
+    def emit(self, event, data=None):
+        self.queue.put((event, data))
+
+ingestion_events = IngestionEvents()
+
+def relay_ingestion_events():
+    """Forward events queued by the native ingestion threads to SocketIO clients from the hub"""
+    while True:
+        try:
+            # The blocking get runs on a tpool thread, which wakes this greenlet only when an event arrives
+            events = [tpool.execute(ingestion_events.queue.get)]
+        except Exception as e:
+            logger.error(f"Error waiting for ingestion events: {e}")
+            socketio.sleep(1)
+            continue
+        # Send everything that queued up meanwhile in the same wake-up
+        while True:
+            try:
+                events.append(ingestion_events.queue.get_nowait())
+            except native_queue.Empty:
+                break
+        for event, data in events:
+            try:
+                socketio.emit(event, data)
+            except Exception as e:
+                logger.error(f"Error relaying {event} event: {e}")
+
+def create_pooled_alert(*args, **kwargs):
+    """Create an alert over a borrowed pool connection rather than a per-greenlet one"""
+    with borrow_conn() as conn:
+        return create_alert(*args, conn=conn, **kwargs)
+
 def start_pipeline():
     global pipeline_thread
     try:
         if pipeline_thread is None or not pipeline_thread.is_alive():
             logger.info("Starting Pathway pipeline")
-            from ingestion import pipeline
-            pipeline_thread = threading.Thread(
-                target=pipeline, args=(current_symbols, socketio)
+            pipeline_thread = native_threading.Thread(
+                target=pipeline, args=(current_symbols, ingestion_events)
             )
             pipeline_thread.daemon = True
             pipeline_thread.start()
@@ -60,62 +199,84 @@ def start_pipeline():
         logger.error(f"Error starting pipeline: {e}")
 
 def get_mock_ipo_data(limit=10):
-    """Return mock IPO data for consistent display"""
+    """Return mock IPO data for consistent display, rebuilt at most once per day"""
+    global ipo_cache_date, ipo_cache_data, ipo_cache_json
     try:
-        # Simulate recent and upcoming IPOs with realistic data
-        base_date = datetime.now()
-        mock_ipos = [
-            {
-                "company": "TechTrend Innovations",
-                "symbol": "TTI",
-                "ipo_date": (base_date + timedelta(days=10)).strftime("%Y-%m-%d"),
-                "price_range": "$12-$15"
-            },
-            {
-                "company": "GreenWave Energy",
-                "symbol": "GWE",
-                "ipo_date": (base_date + timedelta(days=5)).strftime("%Y-%m-%d"),
-                "price_range": "$18-$22"
-            },
-            {
-                "company": "AIHealth Solutions",
-                "symbol": "AIHS",
-                "ipo_date": (base_date - timedelta(days=2)).strftime("%Y-%m-%d"),
-                "price_range": "$25-$30"
-            },
-            {
-                "company": "Quantum Computing Inc.",
-                "symbol": "QCI",
-                "ipo_date": (base_date + timedelta(days=15)).strftime("%Y-%m-%d"),
-                "price_range": "$10-$14"
-            },
-            {
-                "company": "EcoMaterials Ltd.",
-                "symbol": "EML",
-                "ipo_date": (base_date - timedelta(days=10)).strftime("%Y-%m-%d"),
-                "price_range": "$16-$20"
-            }
-        ]
-        logger.debug(f"Generated mock IPO data: {len(mock_ipos)} IPOs")
-        return mock_ipos[:limit]
+        today = datetime.now().date()
+        if ipo_cache_date != today:
+            # Simulate recent and upcoming IPOs with realistic data
+            base_date = datetime.now()
+            mock_ipos = [
+                {
+                    "company": "TechTrend Innovations",
+                    "symbol": "TTI",
+                    "ipo_date": (base_date + timedelta(days=10)).strftime("%Y-%m-%d"),
+                    "price_range": "$12-$15"
+                },
+                {
+                    "company": "GreenWave Energy",
+                    "symbol": "GWE",
+                    "ipo_date": (base_date + timedelta(days=5)).strftime("%Y-%m-%d"),
+                    "price_range": "$18-$22"
+                },
+                {
+                    "company": "AIHealth Solutions",
+                    "symbol": "AIHS",
+                    "ipo_date": (base_date - timedelta(days=2)).strftime("%Y-%m-%d"),
+                    "price_range": "$25-$30"
+                },
+                {
+                    "company": "Quantum Computing Inc.",
+                    "symbol": "QCI",
+                    "ipo_date": (base_date + timedelta(days=15)).strftime("%Y-%m-%d"),
+                    "price_range": "$10-$14"
+                },
+                {
+                    "company": "EcoMaterials Ltd.",
+                    "symbol": "EML",
+                    "ipo_date": (base_date - timedelta(days=10)).strftime("%Y-%m-%d"),
+                    "price_range": "$16-$20"
+                }
+            ]
+            ipo_cache_data = mock_ipos
+            # Encoded once per day so /api/ipo_data doesn't re-serialize the same payload
+            ipo_cache_json = orjson.dumps({"ipos": mock_ipos})
+            ipo_cache_date = today
+            logger.debug(f"Generated mock IPO data: {len(mock_ipos)} IPOs")
+        return ipo_cache_data[:limit]
     except Exception as e:
         logger.error(f"Error generating mock IPO data: {e}")
         return None
 
 def background_ipo_task():
-    """Periodically emit IPO data to keep frontend updated"""
+    """Emit IPO data to the frontend whenever the daily cache is rebuilt"""
+    last_emitted_date = None
     while True:
         try:
             ipo_data = get_mock_ipo_data(limit=10)
             if ipo_data:
-                socketio.emit("ipo_update", {"ipos": ipo_data})
-                logger.debug("Emitted IPO data via SocketIO")
+                if ipo_cache_date != last_emitted_date:
+                    socketio.emit("ipo_update", {"ipos": ipo_data})
+                    last_emitted_date = ipo_cache_date
+                    logger.debug("Emitted IPO data via SocketIO")
             else:
                 logger.warning("No IPO data to emit")
-            time.sleep(30)  # Emit every 30 seconds
+            # Nothing changes until the date rolls over, so wake up at midnight (or hourly at most)
+            now = datetime.now()
+            next_day = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            socketio.sleep(min(3600, (next_day - now).total_seconds() + 1))
         except Exception as e:
             logger.error(f"Error in background IPO task: {e}")
-            time.sleep(30)
+            socketio.sleep(30)
+
+def conditional_json(payload):
+    """Wrap pre-encoded JSON in a response carrying an ETag, answering 304 when the client is current"""
+    if isinstance(payload, str):
+        payload = payload.encode()
+    resp = make_response(payload)
+    resp.mimetype = "application/json"
+    resp.set_etag(hashlib.md5(payload).hexdigest())
+    return resp.make_conditional(request)
 
 @app.route("/")
 def index():
@@ -125,25 +286,26 @@ def index():
 @app.route("/api/data", methods=["GET"])
 def get_data():
     try:
-        conn = get_db_connection()
-        query = """
-        SELECT symbol, price, datetime, moving_avg, volatility 
-        FROM stock_data 
-        WHERE symbol IN ({}) 
-        ORDER BY datetime DESC 
-        LIMIT 100
-        """.format(",".join("?" for _ in current_symbols))
-        df = pd.read_sql_query(query, conn, params=current_symbols)
-        conn.close()
-        if df.empty:
+        symbols = current_symbols
+        if data_query_cache["symbols"] is not symbols:
+            data_query_cache["param"] = orjson.dumps(symbols).decode()
+            data_query_cache["symbols"] = symbols
+        with borrow_conn() as conn:
+            rows = conn.execute(DATA_QUERY, (data_query_cache["param"],)).fetchall()
+        if not rows:
             logger.warning("No data found in database")
             return jsonify({"error": "No data available", "symbols": current_symbols}), 200
-        data = (
-            df.groupby("symbol")
-            .apply(lambda x: x[["price", "datetime", "moving_avg", "volatility"]].to_dict(orient="records"))
-            .to_dict()
-        )
-        logger.debug(f"API /api/data returned data for symbols: {list(data.keys())}")
+        data = {}
+        for row in rows:
+            data.setdefault(row["symbol"], []).append(
+                {
+                    "price": row["price"],
+                    "datetime": row["datetime"],
+                    "moving_avg": row["moving_avg"],
+                    "volatility": row["volatility"],
+                }
+            )
+        logger.opt(lazy=True).debug("API /api/data returned data for symbols: {}", lambda: list(data.keys()))
         return jsonify({"data": data, "symbols": current_symbols})
     except Exception as e:
         logger.error(f"Error fetching data: {e}")
@@ -152,12 +314,10 @@ def get_data():
 @app.route("/api/alert_history", methods=["GET"])
 def get_alert_history():
     try:
-        conn = get_db_connection()
         query = "SELECT message, trigger_time FROM alert_history ORDER BY trigger_time DESC LIMIT 50"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        alerts = df.to_dict(orient="records")
-        logger.debug(f"Fetched alert history: {len(alerts)} alerts")
+        with borrow_conn() as conn:
+            alerts = [dict(row) for row in conn.execute(query).fetchall()]
+        logger.debug("Fetched alert history: {} alerts", len(alerts))
         return jsonify({"alerts": alerts})
     except Exception as e:
         logger.error(f"Error fetching alert history: {e}")
@@ -168,8 +328,8 @@ def get_ipo_data():
     try:
         ipo_data = get_mock_ipo_data(limit=10)
         if ipo_data:
-            logger.debug(f"Fetched IPO data: {len(ipo_data)} IPOs")
-            return jsonify({"ipos": ipo_data})
+            logger.debug("Fetched IPO data: {} IPOs", len(ipo_data))
+            return conditional_json(ipo_cache_json)
         else:
             logger.warning("No IPO data returned from mock data")
             fallback_data = [
@@ -210,13 +370,15 @@ def get_ipo_data():
 @app.route("/api/news_data", methods=["GET"])
 def get_news_data():
     try:
-        conn = get_db_connection()
-        query = "SELECT title, date FROM news ORDER BY date DESC LIMIT 10"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        news_data = df.to_dict(orient="records")
-        logger.debug(f"Fetched news data: {len(news_data)} articles")
-        return jsonify({"news": news_data})
+        payload = cache.get("news_data")
+        if payload is None:
+            query = "SELECT title, date FROM news ORDER BY date DESC LIMIT 10"
+            with borrow_conn() as conn:
+                news_data = [dict(row) for row in conn.execute(query).fetchall()]
+            logger.debug("Fetched news data: {} articles", len(news_data))
+            payload = orjson.dumps({"news": news_data})
+            cache.set("news_data", payload, timeout=NEWS_CACHE_TIMEOUT)
+        return conditional_json(payload)
     except Exception as e:
         logger.error(f"Error fetching news data: {e}")
         fallback_data = [
@@ -235,28 +397,24 @@ def get_news_data():
 @app.route("/api/set_alert", methods=["POST"])
 def set_alert():
     try:
-        data = request.json
-        alert_type = data.get("alert_type")
-        symbol = data.get("symbol").upper()
-        value = data.get("value", "")
+        try:
+            req = msgspec.json.decode(request.get_data(), type=AlertRequest)
+        except msgspec.DecodeError as e:
+            logger.warning(f"Invalid set_alert request body: {e}")
+            return jsonify({"error": str(e)}), 400
+        alert_type = req.alert_type
+        symbol = req.symbol.upper()
+        value = req.value
         if not symbol or not alert_type:
             logger.warning("Missing symbol or alert_type in set_alert request")
             return jsonify({"error": "Symbol and alert type are required"}), 400
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT price FROM stock_data WHERE symbol = ? ORDER BY datetime DESC LIMIT 1",
-            (symbol,),
-        )
-        result = cursor.fetchone()
-        reference_price = result["price"] if result else None
-        from ingestion import create_alert
+        reference_price = get_last_price(symbol)
         if alert_type == "price_change":
-            create_alert(symbol, "price_change", reference_price=reference_price)
+            create_pooled_alert(symbol, "price_change", reference_price=reference_price)
             response = f"Alert set for {symbol} price change."
         elif alert_type == "percent_change":
             percent = float(value) if value else 0.02
-            create_alert(
+            create_pooled_alert(
                 symbol,
                 "percent_change",
                 percent=percent,
@@ -266,7 +424,7 @@ def set_alert():
         elif alert_type == "high_low":
             threshold = float(value) if value else None
             if threshold:
-                create_alert(
+                create_pooled_alert(
                     symbol, "high_low", low=threshold * 0.95, high=threshold * 1.05
                 )
                 response = f"Alert set for {symbol} high/low around {threshold} (±5%)."
@@ -276,9 +434,7 @@ def set_alert():
         else:
             logger.warning(f"Invalid alert type: {alert_type}")
             return jsonify({"error": "Invalid alert type"}), 400
-        conn.close()
-        logger.info(f"Emitting query_response: {response}")
-        socketio.emit("query_response", {"response": response})
+        emit_query_response(response, req.sid)
         return jsonify({"status": "success", "message": response})
     except Exception as e:
         logger.error(f"Error setting alert: {e}")
@@ -286,76 +442,82 @@ def set_alert():
 
 @app.route("/api/query", methods=["POST"])
 def handle_query():
+    sid = (request.get_json(silent=True) or {}).get("sid")
     try:
         query = request.json.get("query", "").lower()
+        if not query.strip():
+            logger.warning("Empty query in query request")
+            return jsonify({"error": "Query is required"}), 400
         logger.info(f"Received query: {query}")
-        conn = get_db_connection()
-        if "notify" in query:
-            symbol = None
-            for s in current_symbols:
-                if s.lower() in query:
-                    symbol = s
-                    break
+        hits = {keyword for _, keyword in query_automaton.iter(query)}
+        alert_handled = False
+        if "notify" in hits:
+            symbol = next((up for low, up in symbols_lower_to_upper.items() if low in hits), None)
             if symbol:
-                if "increase" in query:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "SELECT price FROM stock_data WHERE symbol = ? ORDER BY datetime DESC LIMIT 1",
-                        (symbol,),
-                    )
-                    result = cursor.fetchone()
-                    reference_price = result["price"] if result else None
+                if "increase" in hits:
+                    reference_price = get_last_price(symbol)
                     if reference_price:
-                        from ingestion import create_alert
-                        create_alert(
+                        alert_handled = create_pooled_alert(
                             symbol,
                             "percent_change",
                             percent=0.02,
                             reference_price=reference_price,
                         )
                         response = f"Alert set for {symbol} price increase."
-                        logger.info(f"Emitting query_response: {response}")
-                        socketio.emit("query_response", {"response": response})
-                elif "change" in query:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "SELECT price FROM stock_data WHERE symbol = ? ORDER BY datetime DESC LIMIT 1",
-                        (symbol,),
-                    )
-                    result = cursor.fetchone()
-                    reference_price = result["price"] if result else None
+                elif "change" in hits:
+                    reference_price = get_last_price(symbol)
                     if reference_price:
-                        from ingestion import create_alert
-                        create_alert(
+                        alert_handled = create_pooled_alert(
                             symbol, "price_change", reference_price=reference_price
                         )
                         response = f"Alert set for {symbol} price change."
-                        logger.info(f"Emitting query_response: {response}")
-                        socketio.emit("query_response", {"response": response})
-        response = query_llm(query)
-        logger.debug(f"LLM raw response: {response}")
+        if not alert_handled:
+            # Only fall back to the LLM when the query wasn't a recognised alert request
+            chunks = []
+            for chunk in stream_llm(query):
+                chunks.append(chunk)
+                if sid:
+                    socketio.emit("query_chunk", {"chunk": chunk}, to=sid)
+            response = "".join(chunks)
+            logger.debug("LLM raw response: {}", response)
         response_str = str(response).strip() if response else "No response from LLM"
-        logger.info(f"Emitting query_response: {response_str}")
-        socketio.emit("query_response", {"response": response_str})
-        conn.close()
+        emit_query_response(response_str, sid)
         logger.info(f"Query processed successfully for: {query}")
         return jsonify({"status": "success", "response": response_str})
     except Exception as e:
         logger.error(f"Error handling query: {e}")
         error_response = f"Error processing query: {str(e)}"
-        socketio.emit("query_response", {"response": error_response})
+        emit_query_response(error_response, sid)
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/query_stream", methods=["POST"])
+def handle_query_stream():
+    """Stream the LLM answer as plain text chunks over HTTP"""
+    query = (request.get_json(silent=True) or {}).get("query", "").lower()
+    if not query.strip():
+        logger.warning("Empty query in query_stream request")
+        return jsonify({"error": "Query is required"}), 400
+    logger.info(f"Received streaming query: {query}")
+    return Response(stream_with_context(stream_llm(query)), mimetype="text/plain")
+
 @app.route("/api/update_symbols", methods=["POST"])
 def update_symbols():
-    global current_symbols
+    global current_symbols, query_automaton, symbols_lower_to_upper
     try:
-        symbols = request.json.get("symbols", "")
+        try:
+            req = msgspec.json.decode(request.get_data(), type=SymbolsRequest)
+        except msgspec.DecodeError as e:
+            logger.warning(f"Invalid update_symbols request body: {e}")
+            return jsonify({"error": str(e)}), 400
+        symbols = req.symbols
         new_symbols = [s.strip().upper() for s in symbols.split(",") if s.strip()]
         if not new_symbols:
             logger.warning("No valid symbols provided in update_symbols request")
             return jsonify({"error": "No valid symbols provided"}), 400
-        current_symbols = new_symbols
+        current_symbols = tuple(new_symbols)
+        data_query_cache["symbols"] = None
+        query_automaton = build_query_automaton(current_symbols)
+        symbols_lower_to_upper = {s.lower(): s for s in current_symbols}
         logger.info(f"Updated symbols: {current_symbols}")
         start_pipeline()
         return jsonify({"status": "success", "symbols": current_symbols})
@@ -363,10 +525,14 @@ def update_symbols():
         logger.error(f"Error updating symbols: {e}")
         return jsonify({"error": str(e)}), 500
 
+def start_background_services():
+    """Start the Pathway pipeline, its event relay and the IPO broadcaster next to the web server"""
+    start_pipeline()
+    socketio.start_background_task(relay_ingestion_events)
+    socketio.start_background_task(background_ipo_task)
+
 if __name__ == "__main__":
+    # Local entry point; deployments run under gunicorn with gunicorn_conf.py
     logger.info("Starting Flask server and Pathway pipeline")
-    start_pipeline()
-    # Start background task for IPO data emission
-    ipo_thread = threading.Thread(target=background_ipo_task, daemon=True)
-    ipo_thread.start()
-    socketio.run(app, host="0.0.0.0", port=5000, debug=True)
+    start_background_services()
+    socketio.run(app, host="0.0.0.0", port=5000, debug=os.getenv("FLASK_ENV") == "development")
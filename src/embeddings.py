@@ -0,0 +1,61 @@
+import os
+import numpy as np
+from loguru import logger
+from sentence_transformers import SentenceTransformer
+
+try:
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+    HAVE_ONNXRUNTIME = True
+except ImportError:
+    HAVE_ONNXRUNTIME = False
+
+# Directory produced by `optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 minilm-onnx/`
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "minilm-onnx")
+# Preferred over model.onnx when present (int8 dynamic quantization via `optimum-cli onnxruntime quantize`)
+ONNX_MODEL_FILES = ("model_quantized.onnx", "model.onnx")
+
+class OnnxEmbedder:
+    """SentenceTransformer-compatible encoder backed by an exported ONNX graph on onnxruntime"""
+
+    def __init__(self, model_path: str, tokenizer_dir: str):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir)
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            tokens = self.tokenizer(
+                sentences[start:start + batch_size], padding=True, truncation=True, return_tensors="np"
+            )
+            feeds = {name: value.astype(np.int64) for name, value in tokens.items() if name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            # Mean pooling over real tokens, as the SentenceTransformer pooling layer does
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled.astype(np.float32))
+        embeddings = np.concatenate(batches) if batches else np.empty((0, 0), dtype=np.float32)
+        if normalize_embeddings and len(embeddings):
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+def load_embedding_model(model_name: str, device: str = None):
+    """Use the ONNX export when it and onnxruntime are available, otherwise the PyTorch SentenceTransformer"""
+    if HAVE_ONNXRUNTIME and (device is None or device == "cpu"):
+        for filename in ONNX_MODEL_FILES:
+            model_path = os.path.join(EMBEDDING_ONNX_DIR, filename)
+            if os.path.exists(model_path):
+                try:
+                    embedder = OnnxEmbedder(model_path, EMBEDDING_ONNX_DIR)
+                    logger.info(f"Loaded ONNX embedding model from {model_path}")
+                    return embedder
+                except Exception as e:
+                    logger.error(f"Error loading ONNX embedding model, falling back to PyTorch: {e}")
+                    break
+    return SentenceTransformer(model_name, device=device)
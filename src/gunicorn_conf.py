@@ -0,0 +1,23 @@
+# Gunicorn settings for serving StockPulse: gunicorn -c gunicorn_conf.py app:app
+import eventlet
+from eventlet import hubs
+from gunicorn.workers.geventlet import EventletWorker, patch_sendfile
+
+bind = "0.0.0.0:5000"
+# SocketIO needs sticky sessions once there is more than one worker, so keep a
+# single eventlet worker and let it multiplex the websocket clients
+worker_class = "gunicorn_conf.NativeThreadEventletWorker"
+workers = 1
+worker_connections = 10000
+
+class NativeThreadEventletWorker(EventletWorker):
+    """Eventlet worker that leaves threading unpatched, matching app.py's monkey_patch(thread=False)"""
+
+    def patch(self):
+        hubs.use_hub()
+        eventlet.monkey_patch(thread=False)
+        patch_sendfile()
+
+def post_worker_init(worker):
+    from app import start_background_services
+    start_background_services()
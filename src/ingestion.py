@@ -6,18 +6,32 @@ import datetime
 import pytz
 from typing import Any, Dict, List, Optional
 import os
+import sys
 from loguru import logger
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from retry import retry
-import random
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from embeddings import load_embedding_model, OnnxEmbedder
+import torch
 import json
+from kernels import rolling_mean_std, move_mean_std, HAVE_NUMBA, HAVE_BOTTLENECK
 
-logger.remove()
-logger.add("stocks_data.log", format="{time} - {name} - {level} - {message}", level="DEBUG", rotation="10 MB")
-logger.add(lambda msg: print(msg, end=""), format="{time} - {name} - {level} - {message}", level="DEBUG")
+try:
+    import intel_extension_for_pytorch as ipex
+except ImportError:
+    ipex = None
+
+LOG_LEVEL = os.getenv("LOGLEVEL", "INFO")
+
+def configure_logging():
+    """Sinks for standalone runs; when imported by app.py, the server configures logging instead"""
+    # Sinks format and write from loguru's background queue; set LOGLEVEL=DEBUG for per-tick detail
+    logger.remove()
+    logger.add("stocks_data.log", format="{time} - {name} - {level} - {message}", level=LOG_LEVEL, rotation="10 MB", enqueue=True)
+    logger.add(sys.stdout, format="{time} - {name} - {level} - {message}", level=LOG_LEVEL, enqueue=True)
 
 # Load API keys from environment variables
 API_KEYS = os.getenv("TWELVE_DATA_API_KEYS", "").split(",")
@@ -27,21 +41,37 @@ if not API_KEYS or all(key.strip() == "" for key in API_KEYS):
 
 DB_PATH = "stock_history.db"
 FAISS_INDEX_PATH = "faiss_index.bin"
-FAISS_METADATA_PATH = "faiss_metadata.json"
+FAISS_METADATA_PATH = "faiss_metadata.jsonl"
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 40
+FAISS_SQ_TRAIN_SIZE = 4096  # Vectors collected before switching the index to 8-bit storage
 DEFAULT_SYMBOLS = ["NVDA", "AAPL", "MSFT", "GOOGL"]
 FETCH_INTERVAL = "1min"
 MAX_RETRIES = 3
 BACKOFF_FACTOR = 2
 API_REQUESTS_PER_MINUTE = 8
-SLEEP_BETWEEN_SYMBOL_REQUESTS = 10
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# bfloat16 inference on CPU is only worth it with IPEX's optimized kernels
+EMBEDDING_BF16 = EMBEDDING_DEVICE == "cpu" and ipex is not None
 
 API_KEY_INDEX = 0
-API_KEY_REQUEST_COUNTS = {key: 0 for key in API_KEYS}
-LAST_RESET_TIME = time.time()
+# Per-key token buckets: [tokens available, monotonic time of last refill]
+API_KEY_BUCKETS = {key: [float(API_REQUESTS_PER_MINUTE), time.monotonic()] for key in API_KEYS}
+api_key_lock = threading.Lock()
+# Long-lived so each worker keeps its thread-local DB connection across fetch cycles
+fetch_executor = ThreadPoolExecutor(max_workers=len(API_KEYS), thread_name_prefix="twelvedata")
 
 prev_prices = {}
-embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+faiss_index = None
+# Serializes index creation, add/quantize, write_index and the metadata append so ids and lines stay aligned
+faiss_lock = threading.Lock()
+db_local = threading.local()
+mock_rng = np.random.default_rng()
+embedding_model = load_embedding_model(EMBEDDING_MODEL, device=EMBEDDING_DEVICE)
+if EMBEDDING_BF16 and not isinstance(embedding_model, OnnxEmbedder):
+    embedding_model[0].auto_model = ipex.optimize(embedding_model[0].auto_model, dtype=torch.bfloat16)
 
 REAL_TIME_PRICES = {
     "NVDA": 105.527,
@@ -50,9 +80,25 @@ REAL_TIME_PRICES = {
     "GOOGL": 157.946
 }
 
+INSERT_STOCK_SQL = (
+    "INSERT INTO stock_data (symbol, price, datetime, fetch_time, moving_avg, volatility, text) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+def get_conn() -> sqlite3.Connection:
+    """Return this thread's SQLite connection, opening it (in WAL mode) on first use"""
+    conn = getattr(db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        db_local.conn = conn
+    return conn
+
 def init_db():
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_conn()
         cursor = conn.cursor()
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS stock_data (
@@ -99,6 +145,17 @@ def init_db():
         ''')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_symbol ON stock_data(symbol)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_datetime ON stock_data(datetime)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_symbol_dt ON stock_data(symbol, datetime DESC)')
+        # Read surface for row text: live rows keep the sentence save_to_db stored, bulk-loaded history
+        # (stored without text) gets it derived. Nothing queries row text from SQLite yet; FAISS embeds
+        # the text save_to_db builds in memory. Recreated so older databases pick up the definition.
+        cursor.execute('DROP VIEW IF EXISTS stock_data_text')
+        cursor.execute('''
+        CREATE VIEW stock_data_text AS
+        SELECT id, symbol, price, datetime, fetch_time, moving_avg, volatility,
+               COALESCE(text, 'The current price of ' || symbol || ' is $' || price || ' as of ' || datetime || '.') AS text
+        FROM stock_data
+        ''')
         cursor.execute("PRAGMA table_info(stock_data)")
         columns = [col[1] for col in cursor.fetchall()]
         if 'moving_avg' not in columns:
@@ -108,23 +165,68 @@ def init_db():
             cursor.execute('ALTER TABLE stock_data ADD COLUMN volatility REAL')
             logger.info("Added missing 'volatility' column to stock_data table")
         conn.commit()
-        conn.close()
         logger.info(f"Database initialized at {DB_PATH}")
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
         raise
 
+def quantize_faiss_index(index: faiss.IndexHNSWFlat) -> faiss.IndexHNSWSQ:
+    """Rebuild a float HNSW index over int8 scalar-quantized vectors, keeping ids in order"""
+    vectors = index.reconstruct_n(0, index.ntotal)
+    sq_index = faiss.IndexHNSWSQ(index.d, faiss.ScalarQuantizer.QT_8bit, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    sq_index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    sq_index.train(vectors)
+    sq_index.add(vectors)
+    logger.info(f"Quantized FAISS index to 8-bit storage ({sq_index.ntotal} vectors)")
+    return sq_index
+
+def trim_faiss_metadata(count: int):
+    """Drop metadata lines past the first `count`, left behind when a save stopped before the index write"""
+    with open(FAISS_METADATA_PATH, 'r') as f:
+        lines = f.readlines()
+    if len(lines) > count:
+        tmp_path = FAISS_METADATA_PATH + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(lines[:count])
+        os.replace(tmp_path, FAISS_METADATA_PATH)
+        logger.warning(f"Trimmed {len(lines) - count} FAISS metadata lines with no indexed vector")
+
 def update_faiss_index(data: pd.DataFrame, metadata: List[Dict]):
+    global faiss_index
     try:
         texts = data['text'].tolist()
-        embeddings = embedding_model.encode(texts)
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dimension)
-        index.add(embeddings)
-        faiss.write_index(index, FAISS_INDEX_PATH)
-        with open(FAISS_METADATA_PATH, 'w') as f:
-            json.dump(metadata, f)
-        logger.debug(f"Updated FAISS index with {len(data)} entries")
+        with torch.autocast("cpu", dtype=torch.bfloat16, enabled=EMBEDDING_BF16):
+            embeddings = embedding_model.encode(
+                texts,
+                batch_size=EMBEDDING_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            ).astype('float32')
+        with faiss_lock:
+            if faiss_index is None:
+                if os.path.exists(FAISS_INDEX_PATH) and os.path.exists(FAISS_METADATA_PATH):
+                    faiss_index = faiss.read_index(FAISS_INDEX_PATH)
+                    trim_faiss_metadata(faiss_index.ntotal)
+                else:
+                    # Embeddings are unit-normalized, so inner product ranks by cosine similarity
+                    faiss_index = faiss.IndexHNSWFlat(embeddings.shape[1], FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+                    faiss_index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+                    open(FAISS_METADATA_PATH, 'w').close()
+            # Only the new rows are embedded and appended; metadata lines stay aligned with index ids
+            faiss_index.add(embeddings)
+            if isinstance(faiss_index, faiss.IndexHNSWFlat) and faiss_index.ntotal >= FAISS_SQ_TRAIN_SIZE:
+                faiss_index = quantize_faiss_index(faiss_index)
+            # Metadata is made durable first: readers ignore extra trailing lines, but not missing ones
+            with open(FAISS_METADATA_PATH, 'a') as f:
+                f.writelines(json.dumps(m) + "\n" for m in metadata)
+                f.flush()
+                os.fsync(f.fileno())
+            # The index is written whole to a temp file and swapped in, so a crash never leaves it half written
+            tmp_path = FAISS_INDEX_PATH + ".tmp"
+            faiss.write_index(faiss_index, tmp_path)
+            os.replace(tmp_path, FAISS_INDEX_PATH)
+        logger.debug(f"Added {len(data)} entries to FAISS index ({faiss_index.ntotal} total)")
     except Exception as e:
         logger.error(f"Error updating FAISS index: {e}")
 
@@ -132,11 +234,24 @@ def calculate_analytics(df: pd.DataFrame) -> pd.DataFrame:
     try:
         df = df.copy()
         window_size = 5
-        for symbol in df['symbol'].unique():
-            mask = df['symbol'] == symbol
-            df.loc[mask, 'moving_avg'] = df.loc[mask, 'price'].rolling(window=window_size, min_periods=1).mean()
-            df.loc[mask, 'volatility'] = df.loc[mask, 'price'].rolling(window=window_size, min_periods=1).std()
-        df['volatility'] = df['volatility'].fillna(0)
+        if HAVE_NUMBA or HAVE_BOTTLENECK:
+            # Stable-sort rows so each symbol is one contiguous slice of plain arrays, then scatter results back
+            codes, _ = pd.factorize(df['symbol'])
+            order = np.argsort(codes, kind='stable')
+            prices = df['price'].to_numpy(dtype=np.float64)[order]
+            kernel = rolling_mean_std if HAVE_NUMBA else move_mean_std
+            sorted_ma, sorted_vol = kernel(prices, codes[order], window_size)
+            moving_avg = np.empty_like(sorted_ma)
+            volatility = np.empty_like(sorted_vol)
+            moving_avg[order] = sorted_ma
+            volatility[order] = sorted_vol
+            df['moving_avg'] = moving_avg
+            df['volatility'] = volatility
+        else:
+            rolling = df.groupby('symbol', sort=False)['price'].rolling(window=window_size, min_periods=1)
+            # groupby().rolling() prepends the group key to the index; drop it to align with df
+            df['moving_avg'] = rolling.mean().reset_index(level=0, drop=True)
+            df['volatility'] = rolling.std().reset_index(level=0, drop=True).fillna(0)
         logger.debug(f"Calculated analytics for {len(df)} rows")
         return df
     except Exception as e:
@@ -148,114 +263,142 @@ def save_to_db(df: pd.DataFrame):
         logger.warning("No data to save to database")
         return
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_conn()
         fetch_time = datetime.datetime.now().isoformat()
         df_to_save = df.copy()
         df_to_save['fetch_time'] = fetch_time
-        df_to_save['text'] = df_to_save.apply(
-            lambda row: f"The current price of {row['symbol']} is ${row['price']} as of {row['datetime']}. "
-                       f"Moving average: ${row['moving_avg']:.2f}, Volatility: {row['volatility']:.2f}.",
-            axis=1
-        )
+        symbols = df_to_save['symbol'].tolist()
+        prices = df_to_save['price'].tolist()
+        datetimes = df_to_save['datetime'].tolist()
+        moving_avgs = df_to_save['moving_avg'].tolist()
+        volatilities = df_to_save['volatility'].tolist()
+        texts = [
+            f"The current price of {symbol} is ${price} as of {dt}. "
+            f"Moving average: ${moving_avg:.2f}, Volatility: {volatility:.2f}."
+            for symbol, price, dt, moving_avg, volatility in zip(
+                symbols, prices, datetimes, moving_avgs, volatilities
+            )
+        ]
+        df_to_save['text'] = texts
         metadata = [
-            {"type": "stock", "symbol": row['symbol'], "text": row['text']}
-            for _, row in df_to_save.iterrows()
+            {"type": "stock", "symbol": symbol, "text": text}
+            for symbol, text in zip(symbols, texts)
         ]
-        df_to_save.to_sql('stock_data', conn, if_exists='append', index=False)
+        # One transaction for the whole batch; commits on success, rolls back on error.
+        # IMMEDIATE takes the write lock up front instead of upgrading a read lock mid-batch.
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                INSERT_STOCK_SQL,
+                zip(symbols, prices, datetimes, [fetch_time] * len(symbols), moving_avgs, volatilities, texts),
+            )
         update_faiss_index(df_to_save, metadata)
-        conn.close()
-        logger.debug(f"Saved data to database: {df_to_save[['symbol', 'price', 'datetime']].to_dict()}")
+        logger.opt(lazy=True).debug("Saved data to database: {}", lambda: df_to_save[['symbol', 'price', 'datetime']].to_dict())
     except Exception as e:
         logger.error(f"Database error: {e}")
         raise
 
+def acquire_api_token(api_key: str):
+    """Block until api_key has budget under its per-minute limit, then spend one request"""
+    while True:
+        with api_key_lock:
+            tokens, last_refill = API_KEY_BUCKETS[api_key]
+            now = time.monotonic()
+            tokens = min(API_REQUESTS_PER_MINUTE, tokens + (now - last_refill) * API_REQUESTS_PER_MINUTE / 60)
+            if tokens >= 1:
+                API_KEY_BUCKETS[api_key] = [tokens - 1, now]
+                return
+            API_KEY_BUCKETS[api_key] = [tokens, now]
+            wait = (1 - tokens) * 60 / API_REQUESTS_PER_MINUTE
+        logger.info(f"API key {api_key} limit reached, waiting {wait:.1f} seconds")
+        time.sleep(wait)
+
+def fetch_symbol(symbol: str, api_key: str, interval: str, outputsize: int) -> pd.DataFrame:
+    acquire_api_token(api_key)
+    logger.debug(f"Using API key {api_key} for {symbol}")
+    try:
+        td = TDClient(apikey=api_key)
+        ts = td.time_series(symbol=symbol, interval=interval, outputsize=outputsize, timezone="America/New_York")
+        df = ts.as_pandas()
+        if df is not None and not df.empty:
+            df['symbol'] = symbol
+            df = df.reset_index().rename(columns={"index": "datetime", "close": "price"})
+            return df[["symbol", "price", "datetime"]]
+        logger.warning(f"No data for {symbol} with key {api_key}, using mock data")
+    except Exception as e:
+        logger.warning(f"Error fetching {symbol} with key {api_key}: {e}, using mock data")
+    # Prices only: fetch_stock_data computes analytics and saves the combined batch once, from the calling thread
+    try:
+        return create_mock_prices([symbol])
+    except Exception as e:
+        logger.error(f"Error creating mock data for {symbol}: {e}")
+        return pd.DataFrame()
+
 @retry(tries=MAX_RETRIES, delay=1, backoff=BACKOFF_FACTOR, logger=logger)
 def fetch_stock_data(symbols: List[str] = DEFAULT_SYMBOLS, interval: str = FETCH_INTERVAL, outputsize: int = 5) -> pd.DataFrame:
-    global API_KEY_INDEX, API_KEY_REQUEST_COUNTS, LAST_RESET_TIME
+    global API_KEY_INDEX
     try:
         if not symbols:
             raise ValueError("No symbols provided")
-        current_time = time.time()
-        if current_time - LAST_RESET_TIME >= 60:
-            API_KEY_REQUEST_COUNTS = {key: 0 for key in API_KEYS}
-            LAST_RESET_TIME = current_time
-            logger.debug("Reset API key request counts")
         market_open = is_market_open()
         if not market_open:
             logger.info("Market is closed. Using mock data")
             return create_mock_data(symbols)
-        all_data = pd.DataFrame()
-        for symbol in symbols:
-            api_key = API_KEYS[API_KEY_INDEX]
-            API_KEY_REQUEST_COUNTS[api_key] += 1
-            logger.debug(f"Using API key {api_key} for {symbol} (Request {API_KEY_REQUEST_COUNTS[api_key]}/{API_REQUESTS_PER_MINUTE'})")
-            if API_KEY_REQUEST_COUNTS[api_key] > API_REQUESTS_PER_MINUTE:
-                logger.info(f"API key {api_key} limit reached, waiting 60 seconds")
-                time.sleep(60)
-                API_KEY_REQUEST_COUNTS = {key: 0 for key in API_KEYS}
-                LAST_RESET_TIME = time.time()
-                API_KEY_REQUEST_COUNTS[api_key] = 1
-            try:
-                td = TDClient(apikey=api_key)
-                ts = td.time_series(symbol=symbol, interval=interval, outputsize=outputsize, timezone="America/New_York")
-                df = ts.as_pandas()
-                if df is not None and not df.empty:
-                    df['symbol'] = symbol
-                    all_data = pd.concat([all_data, df])
-                else:
-                    logger.warning(f"No data for {symbol} with key {api_key}, using mock data")
-                    mock_df = create_mock_data([symbol])
-                    all_data = pd.concat([all_data, mock_df])
-            except Exception as e:
-                logger.warning(f"Error fetching {symbol} with key {api_key}: {e}, using mock data")
-                mock_df = create_mock_data([symbol])
-                all_data = pd.concat([all_data, mock_df])
-            API_KEY_INDEX = (API_KEY_INDEX + 1) % len(API_KEYS)
-            time.sleep(SLEEP_BETWEEN_SYMBOL_REQUESTS)
+        # Symbols are spread across the keys round-robin and fetched concurrently
+        futures = [
+            fetch_executor.submit(
+                fetch_symbol, symbol, API_KEYS[(API_KEY_INDEX + i) % len(API_KEYS)], interval, outputsize
+            )
+            for i, symbol in enumerate(symbols)
+        ]
+        API_KEY_INDEX = (API_KEY_INDEX + len(symbols)) % len(API_KEYS)
+        frames = [future.result() for future in as_completed(futures)]
+        all_data = pd.concat(frames, ignore_index=True, copy=False) if frames else pd.DataFrame()
         if all_data.empty:
             logger.info("No data from API, falling back to mock data")
             return create_mock_data(symbols)
-        all_data = all_data.reset_index().rename(columns={"index": "datetime", "close": "price"})
-        all_data = all_data[["symbol", "price", "datetime"]]
         all_data['datetime'] = all_data['datetime'].astype(str)
         all_data = calculate_analytics(all_data)
         save_to_db(all_data)
-        logger.debug(f"Fetched stock data: {all_data[['symbol', 'price', 'datetime']].to_dict()}")
+        logger.opt(lazy=True).debug("Fetched stock data: {}", lambda: all_data[['symbol', 'price', 'datetime']].to_dict())
         return all_data
     except Exception as e:
         logger.error(f"API error: {e}")
         return create_mock_data(symbols)
 
+def create_mock_prices(symbols: List[str], base_time=None) -> pd.DataFrame:
+    """One simulated tick per symbol (symbol, price, datetime), continuing from its last stored price"""
+    if base_time is None:
+        base_time = datetime.datetime.now()
+    VOLATILITY = 0.005
+    TREND_STRENGTH = 0.0005
+    cursor = get_conn().cursor()
+    cursor.execute('''
+    SELECT symbol, price, MAX(datetime) FROM stock_data
+    WHERE symbol IN (SELECT value FROM json_each(?))
+    GROUP BY symbol
+    ''', (json.dumps(list(symbols)),))
+    last_prices = {symbol: price for symbol, price, _ in cursor.fetchall()}
+    n = len(symbols)
+    base_prices = np.array([last_prices.get(symbol) or REAL_TIME_PRICES.get(symbol, 100.0) for symbol in symbols], dtype=np.float64)
+    trend_direction = mock_rng.choice([-1, 1], n)
+    change = mock_rng.normal(0, VOLATILITY, n) + (TREND_STRENGTH * trend_direction)
+    new_prices = np.round(base_prices + base_prices * change, 3)
+    new_prices = np.maximum(new_prices, base_prices * 0.5)
+    jump_mask = mock_rng.random(n) < 0.1
+    jumps = mock_rng.uniform(0.01, 0.03, n) * base_prices * mock_rng.choice([-1, 1], n)
+    new_prices = np.where(jump_mask, np.round(new_prices + jumps, 3), new_prices)
+    mock_data = {
+        "symbol": list(symbols),
+        "price": new_prices,
+        "datetime": [base_time.strftime("%Y-%m-%d %H:%M:%S")] * n
+    }
+    return pd.DataFrame(mock_data)
+
 def create_mock_data(symbols: List[str], base_time=None) -> pd.DataFrame:
     try:
-        mock_data = []
-        if base_time is None:
-            base_time = datetime.datetime.now()
-        VOLATILITY = 0.005
-        TREND_STRENGTH = 0.0005
-        for symbol in symbols:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("SELECT price FROM stock_data WHERE symbol = ? ORDER BY datetime DESC LIMIT 1", (symbol,))
-            result = cursor.fetchone()
-            conn.close()
-            base_price = result[0] if result else REAL_TIME_PRICES.get(symbol, 100.0)
-            trend_direction = random.choice([-1, 1])
-            change = random.gauss(0, VOLATILITY) + (TREND_STRENGTH * trend_direction)
-            price_change = base_price * change
-            new_price = round(base_price + price_change, 3)
-            new_price = max(new_price, base_price * 0.5)
-            if random.random() < 0.1:
-                jump = random.uniform(0.01, 0.03) * base_price
-                new_price = round(new_price + (jump * random.choice([-1, 1])), 3)
-            mock_data.append({
-                "symbol": symbol,
-                "price": new_price,
-                "datetime": base_time.strftime("%Y-%m-%d %H:%M:%S")
-            })
-        df = pd.DataFrame(mock_data)
-        df = calculate_analytics(df)
-        logger.debug(f"Generated mock data: {df.to_dict()}")
+        df = calculate_analytics(create_mock_prices(symbols, base_time))
+        logger.opt(lazy=True).debug("Generated mock data: {}", lambda: df.to_dict())
         save_to_db(df)
         return df
     except Exception as e:
@@ -276,20 +419,27 @@ def is_market_open() -> bool:
 
 def monitor_alerts(socketio):
     global prev_prices
+    conn = get_conn()
     try:
-        conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         cursor.execute("SELECT id, symbol, alert_type, low, high, range_low, range_high, trend_condition, percent, reference_price FROM alerts WHERE status = 'active'")
         alerts = cursor.fetchall()
-        recent_data = pd.read_sql_query("SELECT symbol, price FROM stock_data ORDER BY datetime DESC LIMIT 100", conn)
+        # SQLite returns the bare price column from the row holding MAX(datetime) in each group
+        cursor.execute('''
+        SELECT symbol, price, MAX(datetime) FROM stock_data
+        WHERE symbol IN (SELECT symbol FROM alerts WHERE status = 'active')
+        GROUP BY symbol
+        ''')
+        latest_prices = {symbol: price for symbol, price, _ in cursor.fetchall()}
         logger.debug(f"Checking {len(alerts)} active alerts")
+        triggered_ids = []
+        history_rows = []
         for alert in alerts:
             alert_id, symbol, alert_type, low, high, range_low, range_high, trend_condition, percent, reference_price = alert
-            symbol_data = recent_data[recent_data['symbol'] == symbol]
-            if symbol_data.empty:
+            latest_price = latest_prices.get(symbol)
+            if latest_price is None:
                 logger.info(f"No recent data for {symbol}")
                 continue
-            latest_price = symbol_data.iloc[0]['price']
             triggered = False
             message = ""
             logger.debug(f"Checking alert for {symbol}: type={alert_type}, price={latest_price}")
@@ -313,32 +463,38 @@ def monitor_alerts(socketio):
                     triggered = True
             if triggered:
                 logger.info(f"Alert triggered: {message}")
-                cursor.execute("UPDATE alerts SET status = 'triggered' WHERE id = ?", (alert_id,))
-                cursor.execute('''
-                INSERT INTO alert_history (alert_id, symbol, message, trigger_time)
-                VALUES (?, ?, ?, ?)
-                ''', (alert_id, symbol, message, datetime.datetime.now().isoformat()))
-                logger.debug(f"Emitting alert_triggered: {message}")
-                socketio.emit('alert_triggered', {'message': message})
+                triggered_ids.append((alert_id,))
+                history_rows.append((alert_id, symbol, message, datetime.datetime.now().isoformat()))
             prev_prices[symbol] = latest_price
+        if triggered_ids:
+            cursor.executemany("UPDATE alerts SET status = 'triggered' WHERE id = ?", triggered_ids)
+            cursor.executemany('''
+            INSERT INTO alert_history (alert_id, symbol, message, trigger_time)
+            VALUES (?, ?, ?, ?)
+            ''', history_rows)
         conn.commit()
-        conn.close()
+        for _, _, message, _ in history_rows:
+            logger.debug(f"Emitting alert_triggered: {message}")
+            socketio.emit('alert_triggered', {'message': message})
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error monitoring alerts: {e}")
 
-def create_alert(symbol: str, alert_type: str, low: float = None, high: float = None, range_low: float = None, range_high: float = None, trend_condition: str = None, percent: float = None, reference_price: float = None):
+def create_alert(symbol: str, alert_type: str, low: float = None, high: float = None, range_low: float = None, range_high: float = None, trend_condition: str = None, percent: float = None, reference_price: float = None, conn: sqlite3.Connection = None):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-        INSERT INTO alerts (symbol, alert_type, low, high, range_low, range_high, trend_condition, percent, reference_price, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (symbol, alert_type, low, high, range_low, range_high, trend_condition, percent, reference_price, 'active'))
-        conn.commit()
-        conn.close()
+        # Web handlers pass a pooled connection; get_conn() is only for the ingestion threads
+        if conn is None:
+            conn = get_conn()
+        with conn:
+            conn.execute('''
+            INSERT INTO alerts (symbol, alert_type, low, high, range_low, range_high, trend_condition, percent, reference_price, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (symbol, alert_type, low, high, range_low, range_high, trend_condition, percent, reference_price, 'active'))
         logger.debug(f"Created alert for {symbol}: {alert_type}")
+        return True
     except Exception as e:
         logger.error(f"Error creating alert: {e}")
+        return False
 
 class StockDataConnector(pw.io.python.ConnectorSubject):
     def __init__(self, symbols: List[str], socketio):
@@ -354,21 +510,18 @@ class StockDataConnector(pw.io.python.ConnectorSubject):
                 if market_open:
                     df = fetch_stock_data(self.symbols)
                 else:
-                    conn = sqlite3.connect(DB_PATH)
-                    cursor = conn.cursor()
+                    cursor = get_conn().cursor()
                     cursor.execute("SELECT MAX(datetime) FROM stock_data")
                     result = cursor.fetchone()
-                    conn.close()
                     self.last_timestamp = pd.to_datetime(result[0]) if result[0] else datetime.datetime.now()
                     self.last_timestamp += datetime.timedelta(minutes=1)
                     df = create_mock_data(self.symbols, self.last_timestamp)
                 if df is not None and not df.empty:
-                    for _, row in df.iterrows():
-                        record = {
-                            "symbol": row["symbol"],
-                            "price": float(row["price"]),
-                            "timestamp": pd.to_datetime(row["datetime"]).replace(tzinfo=pytz.UTC).isoformat()
-                        }
+                    # Parse the whole column once; naive datetimes are treated as UTC like before
+                    timestamps = pd.to_datetime(df["datetime"], utc=True).dt.strftime("%Y-%m-%dT%H:%M:%S+00:00").tolist()
+                    prices = df["price"].astype(float).tolist()
+                    for symbol, price, timestamp in zip(df["symbol"].tolist(), prices, timestamps):
+                        record = {"symbol": symbol, "price": price, "timestamp": timestamp}
                         self.socketio.emit('stock_update', record)
                         logger.debug(f"Streamed: {record['symbol']} - ${record['price']} at {record['timestamp']}")
                     monitor_alerts(self.socketio)
@@ -402,4 +555,5 @@ def pipeline(symbols: List[str], socketio):
         logger.error(f"Error in pipeline: {e}")
 
 if __name__ == "__main__":
+    configure_logging()
     pipeline(DEFAULT_SYMBOLS, None)
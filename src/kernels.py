@@ -0,0 +1,100 @@
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit so the kernels still run as plain Python"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+try:
+    import bottleneck as bn
+    HAVE_BOTTLENECK = True
+except ImportError:
+    HAVE_BOTTLENECK = False
+
+def group_bounds(groups):
+    """Start offsets of each run of equal values in `groups`, plus the end offset"""
+    return np.flatnonzero(np.r_[True, groups[1:] != groups[:-1], True])
+
+def move_mean_std(prices, groups, window):
+    """Same results as rolling_mean_std, computed with bottleneck over each group's slice.
+
+    bottleneck rejects a window longer than the array, so it is clamped to each group's length;
+    with min_count set, a window covering the whole slice gives the same expanding values.
+    """
+    moving_avg = np.empty(prices.shape[0])
+    volatility = np.empty(prices.shape[0])
+    bounds = group_bounds(groups)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        group_prices = prices[start:end]  # A view, not a copy
+        group_window = min(window, end - start)
+        moving_avg[start:end] = bn.move_mean(group_prices, group_window, min_count=1)
+        volatility[start:end] = bn.move_std(group_prices, group_window, min_count=min(2, group_window), ddof=1)
+    np.nan_to_num(volatility, copy=False, nan=0.0)
+    return moving_avg, volatility
+
+@njit(cache=True)
+def rolling_mean_std(prices, groups, window):
+    """Rolling mean and sample std over `window` points, restarting at every group boundary.
+
+    Rows of the same group must be contiguous. Matches pandas' rolling(window, min_periods=1)
+    mean/std, with std reported as 0 where the window holds fewer than two points. The window
+    is maintained incrementally (Welford add/remove), so each row costs O(1).
+    """
+    n = prices.shape[0]
+    moving_avg = np.empty(n)
+    volatility = np.empty(n)
+    start = 0
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    for i in range(n):
+        if i > 0 and groups[i] != groups[i - 1]:
+            start = i
+            count = 0
+            mean = 0.0
+            m2 = 0.0
+        x = prices[i]
+        count += 1
+        delta = x - mean
+        mean += delta / count
+        m2 += delta * (x - mean)
+        if count > window:
+            y = prices[start]
+            start += 1
+            count -= 1
+            delta = y - mean
+            mean -= delta / count
+            m2 -= delta * (y - mean)
+        moving_avg[i] = mean
+        if count > 1:
+            var = m2 / (count - 1)
+            volatility[i] = np.sqrt(var) if var > 0.0 else 0.0
+        else:
+            volatility[i] = 0.0
+    return moving_avg, volatility
+
+@njit(cache=True, nogil=True)
+def random_walk(start_price, changes, jumps, floor):
+    """Minute-by-minute price walk with the floor enforced after every step.
+
+    Each step applies `changes[i]` to the price, rounds to 3 decimals and clamps at `floor`,
+    then applies the signed jump fraction `jumps[i]` (0 for no jump), matching the original
+    per-step Python loop exactly.
+    """
+    n = changes.shape[0]
+    prices = np.empty(n)
+    price = start_price
+    for i in range(n):
+        price = round(price + price * changes[i], 3)
+        price = max(price, floor)
+        if jumps[i] != 0.0:
+            price = round(price + price * jumps[i], 3)
+        prices[i] = price
+    return prices
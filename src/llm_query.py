@@ -1,31 +1,65 @@
 import os
+import sys
+import time
+import json
+import functools
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from loguru import logger
 import sqlite3
-import pandas as pd
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Optional
+from embeddings import load_embedding_model
+from typing import Iterator, List, Dict, Optional
 
-# Setup logging
-logger.remove()
-logger.add("stocks_data.log", format="{time} - {name} - {level} - {message}", level="DEBUG", rotation="10 MB")
-logger.add(lambda msg: print(msg, end=""), format="{time} - {name} - {level} - {message}", level="DEBUG")
+LOG_LEVEL = os.getenv("LOGLEVEL", "INFO")
+
+def configure_logging():
+    """Sinks for standalone use; when imported by app.py, the server configures logging instead"""
+    logger.remove()
+    logger.add("stocks_data.log", format="{time} - {name} - {level} - {message}", level=LOG_LEVEL, rotation="10 MB", enqueue=True)
+    logger.add(sys.stdout, format="{time} - {name} - {level} - {message}", level=LOG_LEVEL, enqueue=True)
 
 DB_PATH = "stock_history.db"
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY", "YOUR_TOGETHER_API_KEY_HERE")
 TOGETHER_API_URL = "https://api.together.ai/v1/chat/completions"
 FAISS_INDEX_PATH = "faiss_index.bin"
-FAISS_METADATA_PATH = "faiss_metadata.json"
+FAISS_METADATA_PATH = "faiss_metadata.jsonl"
+FAISS_HNSW_EF_SEARCH = 32
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
+# Together and RapidAPI calls reuse pooled keep-alive connections
+http_session = requests.Session()
+http_session.mount(
+    "https://",
+    HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=Retry(total=3, backoff_factor=0.5)),
+)
+
+# Last 10 rows per requested symbol, newest first, in one pass over idx_stock_symbol_dt
+STOCK_CONTEXT_QUERY = """
+SELECT symbol, price, datetime, moving_avg, volatility FROM (
+    SELECT symbol, price, datetime, moving_avg, volatility,
+           ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY datetime DESC) AS rn
+    FROM stock_data
+    WHERE symbol IN (SELECT value FROM json_each(?))
+)
+WHERE rn <= 10
+ORDER BY symbol, datetime DESC
+"""
+
+# Stock context rows for the current minute, keyed by symbol
+stock_data_cache = {"minute": None, "data": {}}
+
+# Index and metadata are reloaded only when ingestion rewrites the files
+faiss_cache = {"index_mtime": None, "index": None, "metadata_mtime": None, "metadata": []}
+
 # Initialize embedding model
 try:
-    embedding_model = SentenceTransformer(EMBEDDING_MODEL)
-    logger.debug("SentenceTransformer model loaded")
+    embedding_model = load_embedding_model(EMBEDDING_MODEL)
+    logger.debug("Embedding model loaded")
 except Exception as e:
-    logger.error(f"Error loading SentenceTransformer: {e}")
+    logger.error(f"Error loading embedding model: {e}")
     raise
 
 def get_db_connection():
@@ -38,46 +72,68 @@ def get_db_connection():
         logger.error(f"Database connection error: {e}")
         raise
 
-def load_faiss_index() -> Optional[faiss.IndexFlatL2]:
+def load_faiss_index() -> Optional[faiss.Index]:
     try:
         if os.path.exists(FAISS_INDEX_PATH):
-            index = faiss.read_index(FAISS_INDEX_PATH)
-            logger.debug("Loaded FAISS index")
-            return index
+            mtime = os.path.getmtime(FAISS_INDEX_PATH)
+            if faiss_cache["index_mtime"] != mtime:
+                faiss_cache["index"] = faiss.read_index(FAISS_INDEX_PATH)
+                faiss_cache["index_mtime"] = mtime
+                logger.debug("Loaded FAISS index")
+            return faiss_cache["index"]
         logger.warning("FAISS index file not found")
         return None
     except Exception as e:
         logger.error(f"Error loading FAISS index: {e}")
         return None
 
-def fetch_stock_data(symbol: str) -> Dict:
+def load_faiss_metadata() -> List[Dict]:
     try:
-        conn = get_db_connection()
-        query = """
-        SELECT price, datetime, moving_avg, volatility 
-        FROM stock_data 
-        WHERE symbol = ? 
-        ORDER BY datetime DESC 
-        LIMIT 10
-        """
-        df = pd.read_sql_query(query, conn, params=(symbol,))
-        conn.close()
-        if df.empty:
-            logger.warning(f"No data for {symbol}")
-            return {"error": f"No data for {symbol}"}
-        latest = df.iloc[0]
-        trends = df[['price', 'datetime']].to_dict(orient="records")
-        logger.debug(f"Fetched stock data for {symbol}")
-        return {
-            "latest_price": latest["price"],
-            "datetime": latest["datetime"],
-            "moving_avg": latest["moving_avg"],
-            "volatility": latest["volatility"],
-            "trends": trends
-        }
+        mtime = os.path.getmtime(FAISS_METADATA_PATH)
+        if faiss_cache["metadata_mtime"] != mtime:
+            with open(FAISS_METADATA_PATH, 'r') as f:
+                faiss_cache["metadata"] = [json.loads(line) for line in f]
+            faiss_cache["metadata_mtime"] = mtime
+            logger.debug("Loaded FAISS metadata")
+        return faiss_cache["metadata"]
     except Exception as e:
-        logger.error(f"Error fetching stock data for {symbol}: {e}")
-        return {"error": str(e)}
+        logger.error(f"Error loading FAISS metadata: {e}")
+        return []
+
+def fetch_stock_data(conn: sqlite3.Connection, symbols: List[str]) -> Dict[str, Dict]:
+    # Repeated queries within the same minute share one SQLite read per symbol
+    minute_bucket = int(time.time() // 60)
+    if stock_data_cache["minute"] != minute_bucket:
+        stock_data_cache["minute"] = minute_bucket
+        stock_data_cache["data"] = {}
+    cached = stock_data_cache["data"]
+    results = {symbol: cached[symbol] for symbol in symbols if symbol in cached}
+    missing = [symbol for symbol in symbols if symbol not in cached]
+    if missing:
+        try:
+            rows = conn.execute(STOCK_CONTEXT_QUERY, (json.dumps(missing),)).fetchall()
+            grouped = {symbol: [] for symbol in missing}
+            for row in rows:
+                grouped[row["symbol"]].append(row)
+            for symbol, symbol_rows in grouped.items():
+                if not symbol_rows:
+                    # Not cached, so rows that land later in the minute are picked up on the next query
+                    logger.warning(f"No data for {symbol}")
+                    results[symbol] = {"error": f"No data for {symbol}"}
+                    continue
+                latest = symbol_rows[0]
+                results[symbol] = cached[symbol] = {
+                    "latest_price": latest["price"],
+                    "datetime": latest["datetime"],
+                    "moving_avg": latest["moving_avg"],
+                    "volatility": latest["volatility"],
+                    "trends": [{"price": r["price"], "datetime": r["datetime"]} for r in symbol_rows]
+                }
+            logger.debug(f"Fetched stock data for {missing}")
+        except Exception as e:
+            logger.error(f"Error fetching stock data for {missing}: {e}")
+            return {symbol: results.get(symbol, {"error": str(e)}) for symbol in symbols}
+    return {symbol: results[symbol] for symbol in symbols}
 
 def fetch_ipo_data() -> List[Dict]:
     try:
@@ -86,7 +142,7 @@ def fetch_ipo_data() -> List[Dict]:
             "x-rapidapi-key": os.getenv("RAPIDAPI_KEY", "YOUR_RAPIDAPI_KEY_HERE"),
             "x-rapidapi-host": "stock-market-ipo.p.rapidapi.com",
         }
-        response = requests.get(url, headers=headers)
+        response = http_session.get(url, headers=headers)
         logger.debug(f"IPO API response status: {response.status_code}")
         if response.status_code == 200:
             ipo_data = response.json()
@@ -108,35 +164,41 @@ def fetch_ipo_data() -> List[Dict]:
         logger.error(f"Error fetching IPO data: {e}")
         return []
 
-def fetch_news_data() -> List[Dict]:
+def fetch_news_data(conn: sqlite3.Connection) -> List[Dict]:
     try:
-        conn = get_db_connection()
-        query = "SELECT title, date FROM news ORDER BY date DESC LIMIT 5"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        news = df.to_dict(orient="records")
+        rows = conn.execute("SELECT title, date FROM news ORDER BY date DESC LIMIT 5").fetchall()
+        news = [dict(row) for row in rows]
         logger.debug(f"Fetched {len(news)} news articles")
         return news
     except Exception as e:
         logger.error(f"Error fetching news data: {e}")
         return []
 
-def fetch_alerts(symbol: str) -> List[Dict]:
+def fetch_alerts(conn: sqlite3.Connection, symbol: str) -> List[Dict]:
     try:
-        conn = get_db_connection()
-        query = "SELECT message, trigger_time FROM alert_history WHERE symbol = ? ORDER BY trigger_time DESC LIMIT 5"
-        df = pd.read_sql_query(query, conn, params=(symbol,))
-        conn.close()
-        alerts = df.to_dict(orient="records")
+        rows = conn.execute(
+            "SELECT message, trigger_time FROM alert_history WHERE symbol = ? ORDER BY trigger_time DESC LIMIT 5",
+            (symbol,)
+        ).fetchall()
+        alerts = [dict(row) for row in rows]
         logger.debug(f"Fetched {len(alerts)} alerts for {symbol}")
         return alerts
     except Exception as e:
         logger.error(f"Error fetching alerts for {symbol}: {e}")
         return []
 
-def semantic_search(query: str, index: faiss.IndexFlatL2, metadata: List[Dict], top_k: int = 5) -> List[Dict]:
+@functools.lru_cache(maxsize=1024)
+def embed_query(query: str) -> np.ndarray:
+    # Index vectors are unit-normalized, so the query must be too for the ranking to match cosine
+    embedding = embedding_model.encode([query], normalize_embeddings=True)[0].astype('float32')
+    embedding.setflags(write=False)  # Shared between callers through the cache
+    return embedding
+
+def semantic_search(query: str, index: faiss.Index, metadata: List[Dict], top_k: int = 5) -> List[Dict]:
     try:
-        query_embedding = embedding_model.encode([query])[0]
+        query_embedding = embed_query(" ".join(query.lower().split()))
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
         D, I = index.search(np.array([query_embedding]), top_k)
         results = [metadata[i] for i in I[0] if i < len(metadata)]
         logger.debug(f"Semantic search results: {results}")
@@ -145,25 +207,38 @@ def semantic_search(query: str, index: faiss.IndexFlatL2, metadata: List[Dict],
         logger.error(f"Error in semantic search: {e}")
         return []
 
-def query_llm(query: str) -> str:
+def stream_llm(query: str) -> Iterator[str]:
+    """Yield the LLM answer piece by piece as Together streams it back"""
+    answer = []
     try:
         symbols = ["NVDA", "AAPL", "MSFT", "GOOGL"]
         query_lower = query.lower()
         context = []
-        for symbol in symbols:
-            if symbol.lower() in query_lower and ("price" in query_lower or "value" in query_lower):
-                stock_data = fetch_stock_data(symbol)
+        wants_prices = "price" in query_lower or "value" in query_lower
+        price_symbols = [symbol for symbol in symbols if wants_prices and symbol.lower() in query_lower]
+        wants_news = "news" in query_lower or "market" in query_lower
+        # All SQLite context for one query is read over a single connection
+        conn = get_db_connection() if price_symbols or wants_news else None
+        try:
+            stock_data_by_symbol = fetch_stock_data(conn, price_symbols) if price_symbols else {}
+            for symbol in price_symbols:
+                stock_data = stock_data_by_symbol[symbol]
                 if "error" not in stock_data:
+                    trends = ", ".join(f"${t['price']} at {t['datetime']}" for t in stock_data["trends"][:3])
                     context.append(
                         f"Latest price of {symbol}: ${stock_data['latest_price']} as of {stock_data['datetime']}.\n"
                         f"Moving average: ${stock_data['moving_avg']:.2f}, Volatility: {stock_data['volatility']:.2f}.\n"
-                        f"Recent trends: {', '.join([f'${t['price']} at {t['datetime']}' for t in stock_data['trends'][:3]])}."
+                        f"Recent trends: {trends}."
                     )
-                    alerts = fetch_alerts(symbol)
+                    alerts = fetch_alerts(conn, symbol)
                     if alerts:
                         context.append(f"Recent alerts for {symbol}: {', '.join([a['message'] for a in alerts[:2]])}.")
                 else:
                     context.append(f"No recent price data for {symbol}.")
+            news = fetch_news_data(conn) if wants_news else []
+        finally:
+            if conn is not None:
+                conn.close()
         if "ipo" in query_lower:
             ipos = fetch_ipo_data()
             if ipos:
@@ -173,8 +248,7 @@ def query_llm(query: str) -> str:
                 )
             else:
                 context.append("No recent IPO data available.")
-        if "news" in query_lower or "market" in query_lower:
-            news = fetch_news_data()
+        if wants_news:
             if news:
                 context.append(
                     "Recent Market News:\n" +
@@ -184,9 +258,7 @@ def query_llm(query: str) -> str:
                 context.append("No recent news available.")
         index = load_faiss_index()
         if index:
-            import json
-            with open(FAISS_METADATA_PATH, 'r') as f:
-                metadata = json.load(f)
+            metadata = load_faiss_metadata()
             search_results = semantic_search(query, index, metadata)
             if search_results:
                 context.append(
@@ -206,14 +278,29 @@ def query_llm(query: str) -> str:
             "top_p": 0.7,
             "top_k": 50,
             "repetition_penalty": 1,
-            "stop": ["<|eot_id|>"]
+            "stop": ["<|eot_id|>"],
+            "stream": True
         }
-        response = requests.post(TOGETHER_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        answer = result['choices'][0]['message']['content'].strip()
-        logger.debug(f"LLM response: {answer}")
-        return answer
+        with http_session.post(TOGETHER_API_URL, headers=headers, json=payload, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                content = chunk['choices'][0].get('delta', {}).get('content')
+                if content:
+                    answer.append(content)
+                    yield content
+        logger.debug(f"LLM response: {''.join(answer)}")
     except Exception as e:
         logger.error(f"Together AI API error: {e}")
-        return f"Sorry, I couldn't process your query due to an error: {str(e)}. Please try again later."
+        if answer:
+            # The client already has part of the answer; end the stream rather than append an apology to it
+            return
+        yield f"Sorry, I couldn't process your query due to an error: {str(e)}. Please try again later."
+
+def query_llm(query: str) -> str:
+    return "".join(stream_llm(query)).strip()
@@ -1,13 +1,26 @@
 import sqlite3
 import pandas as pd
+import numpy as np
 import datetime
-import random
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from loguru import logger
+from kernels import group_bounds, move_mean_std, random_walk, HAVE_BOTTLENECK, HAVE_NUMBA
 
-# Setup logging
-logger.remove()
-logger.add("stocks_data.log", format="{time} - {name} - {level} - {message}", level="DEBUG", rotation="10 MB")
-logger.add(lambda msg: print(msg, end=""), format="{time} - {name} - {level} - {message}", level="DEBUG")
+LOG_LEVEL = os.getenv("LOGLEVEL", "INFO")
+
+def configure_logging():
+    """Sinks for the command-line run; set LOGLEVEL=DEBUG for per-step detail"""
+    logger.remove()
+    logger.add("stocks_data.log", format="{time} - {name} - {level} - {message}", level=LOG_LEVEL, rotation="10 MB", enqueue=True)
+    # Console echo is opt-in so a bulk run never formats records for the terminal
+    if os.getenv("STOCKPULSE_DEBUG"):
+        logger.add(sys.stdout, format="{time} - {name} - {level} - {message}", level=LOG_LEVEL, enqueue=True)
 
 DB_PATH = "stock_history.db"
 SYMBOLS = ["NVDA", "AAPL", "MSFT", "GOOGL"]
@@ -17,61 +30,144 @@ REAL_TIME_PRICES = {
     "MSFT": 383.774,
     "GOOGL": 157.946
 }
+# Above this many rows the sqlite3 shell's CSV importer beats executemany
+CSV_IMPORT_THRESHOLD = 200000
+VOLATILITY = 0.005
+TREND_STRENGTH = 0.0005
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# The descriptive text is not stored; read it through the stock_data_text view, which derives it from these columns
+INSERT_COLUMNS = ["symbol", "price", "datetime", "fetch_time", "moving_avg", "volatility"]
+INSERT_STOCK_SQL = (
+    f"INSERT INTO stock_data ({', '.join(INSERT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(INSERT_COLUMNS))})"
+)
 
 def calculate_analytics(df: pd.DataFrame) -> pd.DataFrame:
     try:
-        df = df.copy()
         window_size = 5
-        for symbol in df['symbol'].unique():
-            mask = df['symbol'] == symbol
-            df.loc[mask, 'moving_avg'] = df.loc[mask, 'price'].rolling(window=window_size, min_periods=1).mean()
-            df.loc[mask, 'volatility'] = df.loc[mask, 'price'].rolling(window=window_size, min_periods=1).std()
-        df['volatility'] = df['volatility'].fillna(0)
-        logger.debug(f"Calculated analytics for mock data: {len(df)} rows")
+        # Rows are generated symbol by symbol, so each symbol is one contiguous slice of the price array.
+        # Kept float64: float32 rolling std drifts visibly at the 2-decimal volatility shown downstream
+        prices = df['price'].to_numpy(dtype=np.float64)
+        codes = df['symbol'].cat.codes.to_numpy()
+        if HAVE_BOTTLENECK:
+            moving_avg, volatility = move_mean_std(prices, codes, window_size)
+            df['moving_avg'] = moving_avg
+            df['volatility'] = volatility
+        else:
+            moving_avg = np.empty_like(prices)
+            window = np.ones(window_size)
+            bounds = group_bounds(codes)
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                # Trailing window sums over the slice, divided by how many points each window holds (min_periods=1)
+                sums = np.convolve(prices[start:end], window)[:end - start]
+                moving_avg[start:end] = sums / np.minimum(np.arange(1, end - start + 1), window_size)
+            df['moving_avg'] = moving_avg
+            rolling = df.groupby('symbol', observed=True, sort=False)['price'].rolling(window=window_size, min_periods=1)
+            # groupby().rolling() prepends the group key to the index; drop it to align with df
+            df['volatility'] = rolling.std().reset_index(level=0, drop=True).fillna(0)
+        logger.opt(lazy=True).debug("Calculated analytics for mock data: {} rows", lambda: len(df))
         return df
     except Exception as e:
         logger.error(f"Error calculating analytics for mock data: {e}")
         return df
 
-def populate_historical_data():
+def import_csv(df: pd.DataFrame, columns: List[str], indexes: List[tuple]):
+    """Replace stock_data's rows with df through a staged CSV and the sqlite3 shell's .import"""
+    column_list = ", ".join(columns)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "stock_data.csv")
+        df[columns].to_csv(csv_path, index=False)
+        # .import creates the staging table from the CSV header, then one INSERT ... SELECT copies it across
+        script = (
+            ".bail on\n"
+            "BEGIN;\n"
+            "DELETE FROM stock_data;\n"
+            + "".join(f'DROP INDEX "{name}";\n' for name, _ in indexes)
+            + f'.import --csv "{csv_path}" stock_data_import\n'
+            f"INSERT INTO stock_data ({column_list}) SELECT {column_list} FROM stock_data_import;\n"
+            "DROP TABLE stock_data_import;\n"
+            + "".join(f"{sql};\n" for _, sql in indexes)
+            + "COMMIT;\n"
+        )
+        subprocess.run([shutil.which("sqlite3"), DB_PATH], input=script, text=True, check=True, capture_output=True)
+
+def simulate_symbol(symbol: str, out: np.ndarray, rng: np.random.Generator):
+    """Fill `out` with one symbol's minute-by-minute price walk"""
+    n = out.shape[0]
+    current_price = REAL_TIME_PRICES.get(symbol, 100.0)
+    floor = current_price * 0.5
+    trend_direction = rng.choice([-1, 1])
+    changes = rng.standard_normal(n) * VOLATILITY + (TREND_STRENGTH * trend_direction)
+    jumps = (rng.random(n) < 0.05) * rng.uniform(0.01, 0.03, n) * rng.choice([-1, 1], n)
+    if HAVE_NUMBA:
+        # Compiled loop keeps the exact per-step rounding and floor
+        out[:] = random_walk(current_price, changes, jumps, floor)
+    else:
+        # Each step multiplies the price by (1 + change) and, on a jump, by (1 + jump); those factors
+        # are independent, so the whole walk is one running product over them
+        walk = current_price * np.cumprod((1 + changes) * (1 + jumps))
+        out[:] = np.round(np.maximum(walk, floor), 3)
+
+def populate_historical_data(seed: Optional[int] = None):
     try:
+        # A fixed seed reproduces the exact same walks; None draws fresh entropy. Each symbol gets its
+        # own independent child stream so the walks can run on separate threads
+        rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(SYMBOLS))]
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM stock_data")
-        conn.commit()
+        # Bulk-load tuning: WAL groups fsyncs, and NORMAL only syncs at checkpoints; a ~200 MB page cache
+        # and in-memory temp storage keep the load off disk until commit
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA cache_size=-200000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
         start_time = datetime.datetime(2025, 5, 2, 9, 30)
         end_time = datetime.datetime(2025, 5, 2, 16, 0)
-        time_step = datetime.timedelta(minutes=1)
-        VOLATILITY = 0.005
-        TREND_STRENGTH = 0.0005
-        mock_data = []
-        for symbol in SYMBOLS:
-            current_price = REAL_TIME_PRICES.get(symbol, 100.0)
-            trend_direction = random.choice([-1, 1])
-            current_time = start_time
-            while current_time <= end_time:
-                change = random.gauss(0, VOLATILITY) + (TREND_STRENGTH * trend_direction)
-                price_change = current_price * change
-                current_price = round(current_price + price_change, 3)
-                current_price = max(current_price, REAL_TIME_PRICES.get(symbol, 100.0) * 0.5)
-                if random.random() < 0.05:
-                    jump = random.uniform(0.01, 0.03) * current_price
-                    current_price = round(current_price + (jump * random.choice([-1, 1])), 3)
-                mock_data.append({
-                    "symbol": symbol,
-                    "price": current_price,
-                    "datetime": current_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "fetch_time": datetime.datetime.now().isoformat(),
-                    "text": f"The current price of {symbol} is ${current_price} as of {current_time.strftime('%Y-%m-%d %H:%M:%S')}."
-                })
-                current_time += time_step
-        df = pd.DataFrame(mock_data)
+        # Every symbol shares the same minute axis and fetch time, so both are formatted exactly once
+        times = pd.date_range(start_time, end_time, freq="1min").strftime(DATETIME_FORMAT).to_numpy(dtype=object)
+        fetch_time = datetime.datetime.now().isoformat()
+        n = len(times)
+        total = n * len(SYMBOLS)
+        # Column arrays are allocated once and each symbol fills its own contiguous slice; the NumPy and
+        # numba kernels release the GIL, so the per-symbol walks run in parallel
+        prices = np.empty(total, dtype=np.float64)
+        slices = [prices[i * n:(i + 1) * n] for i in range(len(SYMBOLS))]
+        with ThreadPoolExecutor(max_workers=len(SYMBOLS)) as executor:
+            list(executor.map(simulate_symbol, SYMBOLS, slices, rngs))
+        df = pd.DataFrame({
+            # Small integer codes instead of a repeated Python string per row; sqlite3 still binds the str values
+            "symbol": pd.Categorical.from_codes(np.repeat(np.arange(len(SYMBOLS), dtype=np.int8), n), SYMBOLS),
+            "price": prices,
+            "datetime": np.tile(times, len(SYMBOLS)),
+            "fetch_time": np.full(total, fetch_time, dtype=object)
+        })
         df = calculate_analytics(df)
-        df.to_sql('stock_data', conn, if_exists='append', index=False)
+        # Indexes are dropped for the load and rebuilt once afterwards instead of being updated row by row
+        cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'stock_data' AND sql IS NOT NULL")
+        indexes = cursor.fetchall()
+        if len(df) > CSV_IMPORT_THRESHOLD and shutil.which("sqlite3"):
+            import_csv(df, INSERT_COLUMNS, indexes)
+        else:
+            # The old rows are cleared and the new batch inserted in one transaction, so there is a single
+            # commit and readers never see an empty table
+            with conn:
+                cursor.execute("DELETE FROM stock_data")
+                for name, _ in indexes:
+                    cursor.execute(f'DROP INDEX "{name}"')
+                cursor.executemany(
+                    INSERT_STOCK_SQL,
+                    # Each column becomes plain Python values once; zip streams the rows into the
+                    # prepared statement without building a list of tuples
+                    zip(*(df[column].tolist() for column in INSERT_COLUMNS))
+                )
+                for _, sql in indexes:
+                    cursor.execute(sql)
         conn.close()
         logger.info(f"Populated historical data with {len(df)} entries")
     except Exception as e:
         logger.error(f"Error populating historical data: {e}")
 
 if __name__ == "__main__":
-    populate_historical_data()
\ No newline at end of file
+    configure_logging()
+    seed = os.getenv("STOCKPULSE_SEED")
+    populate_historical_data(int(seed) if seed else None)
\ No newline at end of file
@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from kernels import rolling_mean_std, move_mean_std, HAVE_BOTTLENECK
+
+WINDOW = 5
+
+def pandas_reference(prices, groups, window):
+    rolling = pd.Series(prices).groupby(groups, sort=False).rolling(window=window, min_periods=1)
+    return (
+        rolling.mean().reset_index(level=0, drop=True).to_numpy(),
+        rolling.std().reset_index(level=0, drop=True).fillna(0).to_numpy(),
+    )
+
+class RollingKernelTest(unittest.TestCase):
+    # Live ingestion yields 1 row per symbol (mock) or up to outputsize=5 (API); history yields many
+    GROUP_SIZES = ([1], [4], [5], [9], [1, 4, 7, 2, 5])
+
+    def check_kernel(self, kernel):
+        rng = np.random.default_rng(0)
+        for sizes in self.GROUP_SIZES:
+            with self.subTest(sizes=sizes):
+                groups = np.repeat(np.arange(len(sizes)), sizes)
+                prices = rng.normal(100.0, 5.0, groups.size)
+                moving_avg, volatility = kernel(prices, groups, WINDOW)
+                expected_avg, expected_vol = pandas_reference(prices, groups, WINDOW)
+                np.testing.assert_allclose(moving_avg, expected_avg)
+                np.testing.assert_allclose(volatility, expected_vol, atol=1e-12)
+
+    def test_rolling_mean_std(self):
+        self.check_kernel(rolling_mean_std)
+
+    @unittest.skipUnless(HAVE_BOTTLENECK, "bottleneck not installed")
+    def test_move_mean_std(self):
+        self.check_kernel(move_mean_std)
+
+    @unittest.skipUnless(HAVE_BOTTLENECK, "bottleneck not installed")
+    def test_move_mean_std_short_groups(self):
+        prices = np.array([1.0, 2.0, 3.0, 4.0])
+        groups = np.array([0, 1, 2, 3])
+        moving_avg, volatility = move_mean_std(prices, groups, WINDOW)
+        np.testing.assert_allclose(moving_avg, prices)
+        np.testing.assert_allclose(volatility, np.zeros(4))
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file